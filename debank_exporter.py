@@ -22,6 +22,7 @@ import asyncio
 import csv
 import io
 import json
+import orjson
 import re
 import utils
 
@@ -162,17 +163,17 @@ def _parse_protocol_balance(protocol: dict, address: str, tag: Optional[str], ba
 async def _query_debank(address: str, tag: Optional[str]) -> List[Balance]:
     balances = []
 
-    token_list_response = await fetch_url(
-        DEBANK_TOKENLIST_FMT.format(address=address)
-    )
-    token_list = json.loads(token_list_response)
+    # The token list and protocol queries are independent, so they are made
+    # concurrently over the shared client.
+    token_list_response, protocols_response = await asyncio.gather(
+        fetch_url(DEBANK_TOKENLIST_FMT.format(address=address)),
+        fetch_url(DEBANK_PROTOCOLS_FMT.format(address=address)))
+
+    token_list = orjson.loads(token_list_response)
     logging.debug(f'{json.dumps(token_list, indent=4)}')
     _parse_wallet_balance(token_list, address, tag, balances)
 
-    protocols_response = await fetch_url(
-        DEBANK_PROTOCOLS_FMT.format(address=address)
-    )
-    protocols = json.loads(protocols_response)
+    protocols = orjson.loads(protocols_response)
     for protocol in protocols:
         logging.debug(f'{json.dumps(protocol, indent=4)}')
         _parse_protocol_balance(protocol, address, tag, balances)
@@ -203,6 +204,7 @@ async def run_exporter(address: str, tag: Optional[str]):
         writer.writeheader()
 
     balances = await _query_debank(address, tag)
+    await utils.close_client()
     _write_csv(balances, savefile)
 
 
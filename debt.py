@@ -21,6 +21,7 @@ from absl import app
 from absl import flags
 from debt_lib import DebtTracker
 import asyncio
+import utils
 
 FLAGS = flags.FLAGS
 flags.DEFINE_string('address', None, 'Your wallet address.')
@@ -31,6 +32,8 @@ flags.mark_flag_as_required('address')
 async def run_tracker(tracker: DebtTracker):
     await tracker.update()
     print(tracker.get_last_message())
+    tracker.close()
+    await utils.close_client()
 
 
 def main(argv):
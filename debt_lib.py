@@ -9,7 +9,6 @@
 from absl import logging
 from datetime import datetime
 from datetime import timezone
-from pathlib import Path
 from typing import List
 from typing import Optional
 from typing import Tuple
@@ -18,11 +17,13 @@ import asyncio
 import csv
 import io
 import json
+import orjson
 import re
 import utils
 
 DEBANK_PROTOCOLS_FMT = 'https://openapi.debank.com/v1/user/complex_protocol_list?id={address}'
 
+SAVEFILE_BUFFER_BYTES = 8192
 SAVEFILE_FIELDS = ['time', 'address', 'tag',
                    'total_assets', 'total_debt', 'individual_debts']
 LARGE_OVERALL_CHANGE = 1000000  # 1 million USD
@@ -61,15 +62,15 @@ class DebtPosition(object):
         self.total_debt = float(dict_in['total_debt'])
         self.individual_debts = json.loads(dict_in['individual_debts'])
 
-    def to_csv_row(self) -> dict:
-        result = {}
-        result['time'] = utils.format_storage_time(self.time)
-        result['address'] = self.address
-        result['tag'] = self.tag
-        result['total_assets'] = self.total_assets
-        result['total_debt'] = self.total_debt
-        result['individual_debts'] = json.dumps(self.individual_debts)
-        return result
+    # Returns the savefile row for this debt position, in SAVEFILE_FIELDS
+    # order.
+    def to_tuple(self) -> tuple:
+        return (utils.format_storage_time(self.time),
+                self.address,
+                self.tag,
+                self.total_assets,
+                self.total_debt,
+                json.dumps(self.individual_debts))
 
 
 def _compute_total_debt(individual_debts: dict) -> float:
@@ -113,11 +114,12 @@ def _parse_protocol_balance(protocol: dict, debt_position: DebtPosition):
         debt_position.total_debt += debt_usd
 
 
-async def _query_new_debts_debank(address: str, tag: Optional[str]) -> DebtPosition:
+async def _query_new_debts_debank(address: str,
+                                  tag: Optional[str]) -> DebtPosition:
     protocols_response = await fetch_url(
         DEBANK_PROTOCOLS_FMT.format(address=address)
     )
-    protocols = json.loads(protocols_response)
+    protocols = orjson.loads(protocols_response)
 
     debt_position = DebtPosition(time=datetime.now(timezone.utc),
                                  address=address,
@@ -157,12 +159,7 @@ def _get_savefile(address: str, tag: Optional[str]) -> str:
 
 
 def _query_prev_debts(savefile: str) -> Optional[DebtPosition]:
-    last_row = None
-    with open(savefile, newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            last_row = row
-
+    last_row = utils.read_last_csv_row(savefile)
     return DebtPosition(csv_row=last_row) if last_row else None
 
 
@@ -361,12 +358,6 @@ def _print_debt_comparison(prev_debts: DebtPosition, debts: DebtPosition, ignora
             print(f'''{diff.change_tokens:+14,.2f} {diff.symbol:<7s} (LTV: {diff.prev_ltv * 100:5.1f}% --> {diff.curr_ltv * 100:5.1f}%) - {diff.display_name}''', file=output)
 
 
-def _write_debts(debts: DebtPosition, savefile: str):
-    with open(savefile, 'a', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, SAVEFILE_FIELDS)
-        writer.writerow(debts.to_csv_row())
-
-
 def _print_title(wallet_name: str, timestamp: datetime, output: io.StringIO):
     print(
         f'Debt Positions for {wallet_name} at {utils.display_time(timestamp)} UTC', file=output)
@@ -393,8 +384,14 @@ class DebtTracker(object):
         self._last_update_time = utils.MIN_TIME
         # A list of channel IDs subscribed to this tracker.
         self._channels = channels if channels else []
+        # The same channel IDs as a set, for constant time membership tests.
+        self._channel_set = set(self._channels)
         # List of debt positions for which we ignore alerts.
         self._ignorable_debts = ignorable_debts if ignorable_debts else []
+        # The most recently recorded debt position. The tracker is the only
+        # writer to its savefile, so this mirrors the last row and spares
+        # re-reading it.
+        self._last_debts: Optional[DebtPosition] = None
 
         # The last time the tracker raised an alert. This is set internally by
         # the sync_last_alert_time() call, as well as externally during
@@ -408,15 +405,42 @@ class DebtTracker(object):
         # update() or _get_last_update().
         self._last_message = f'Tracker for {self.get_name()} just initialized.'
 
-        # Creates a new savefile if needed.
-        if not Path(self._savefile).is_file():
-            with open(self._savefile, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, SAVEFILE_FIELDS)
-                writer.writeheader()
+        # The savefile is held open for appending for the lifetime of the
+        # tracker, so that writes do not reopen it every time. A header is
+        # written if the savefile is new.
+        self._csv_file = open(self._savefile, 'a', newline='',
+                              buffering=SAVEFILE_BUFFER_BYTES)
+        self._csv_writer = csv.writer(self._csv_file)
+        if self._csv_file.tell() == 0:
+            self._csv_writer.writerow(SAVEFILE_FIELDS)
+            self._csv_file.flush()
 
         # Load the latest saved debt data.
         self._get_last_update()
 
+    # Creates a DebtTracker from its JSON representation in the bot config.
+    @classmethod
+    def from_json(cls, tracker_json: dict) -> 'DebtTracker':
+        return cls(address=tracker_json['address'],
+                   tag=tracker_json.get('tag'),
+                   subscribe_command=tracker_json.get('subscribe_command'),
+                   last_alert_time=tracker_json.get('last_alert_time'),
+                   channels=tracker_json.get('channels'),
+                   ignorable_debts=tracker_json.get('ignorable_debts'))
+
+    # Returns the JSON representation of this tracker for the bot config.
+    def to_json(self) -> dict:
+        tracker_json = {'type': type(self).__name__,
+                        'address': self._address}
+        if self._tag:
+            tracker_json['tag'] = self._tag
+        tracker_json['last_alert_time'] = utils.format_storage_time(
+            self._last_alert_time)
+        tracker_json['subscribe_command'] = self._subscribe_command
+        tracker_json['channels'] = self._channels
+        tracker_json['ignorable_debts'] = self._ignorable_debts
+        return tracker_json
+
     def get_name(self) -> str:
         name = self._address
         if self._tag:
@@ -445,10 +469,11 @@ class DebtTracker(object):
         return self._channels
 
     def has_channel(self, channel_id: int) -> bool:
-        return channel_id in self._channels
+        return channel_id in self._channel_set
 
     def add_channel(self, channel_id: int):
         self._channels.append(channel_id)
+        self._channel_set.add(channel_id)
 
     def get_ignorable_debts(self) -> List[str]:
         return self._ignorable_debts
@@ -456,18 +481,30 @@ class DebtTracker(object):
     def get_subscribe_command(self) -> str:
         return self._subscribe_command
 
+    # Closes the savefile. The tracker should not be updated afterwards. Safe to
+    # call more than once.
+    def close(self):
+        if not self._csv_file.closed:
+            self._csv_file.close()
+
     # Sets the last alert time to the last update time. This is useful when
     # there is some caller that is using a different criteria for triggering an
     # alert.
     def sync_last_alert_time(self):
         self._last_alert_time = self._last_update_time
 
+    # Appends a row to the savefile and flushes it.
+    def _write_debts(self, debts: DebtPosition):
+        self._csv_writer.writerow(debts.to_tuple())
+        self._csv_file.flush()
+
     # An internal function that fetches the current state of the tracker without
     # performing new queries.
     def _get_last_update(self) -> Tuple[bool, str]:
         savefile = self._savefile
 
         debts = _query_prev_debts(savefile)
+        self._last_debts = debts
 
         if not debts:
             return False, f'No debts recorded yet for {self.get_name()}.'
@@ -495,11 +532,10 @@ class DebtTracker(object):
     async def update(self) -> Tuple[bool, str]:
         address = self._address
         tag = self._tag
-        savefile = self._savefile
         ignorable_debts = self._ignorable_debts
 
         debts = await _query_new_debts_debank(address, tag)
-        prev_debts = _query_prev_debts(savefile)
+        prev_debts = self._last_debts
         has_alert, alert_message = _get_alert_message(
             prev_debts, debts, ignorable_debts)
 
@@ -535,6 +571,7 @@ class DebtTracker(object):
         if has_alert:
             self.sync_last_alert_time()
 
-        _write_debts(debts, savefile)
+        self._last_debts = debts
+        self._write_debts(debts)
 
         return has_alert, short_message
@@ -11,25 +11,30 @@
 
 from absl import app
 from absl import flags
+from absl import logging
 from collections import defaultdict
 from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
 from debt_lib import DebtTracker
 from discord.ext import tasks
+from functools import lru_cache
 from link_lib import LinkTracker
 from name_lib import NameTracker
 from pathlib import Path
 from typing import List
 from typing import Optional
+from typing import Set
 from typing import Tuple
 
 import asyncio
 import discord
-import json
-import queue
+import hashlib
+import orjson
+import os
 import shutil
-import traceback
+import threading
+import time
 import utils
 
 
@@ -42,7 +47,26 @@ WAIT_PERIOD_MINUTES = 8 * 60
 USAGE_DEBTTRACKER = 'Enter `!{command}` to check current debt positions.'
 USAGE_NAMETRACKER = 'Enter `!{command}` to check name tracker.'
 USAGE_LINKTRACKER = 'Enter `!{command}` to check LINK tracker.'
+USAGE_FORMATS = {
+    DebtTracker.__name__: USAGE_DEBTTRACKER,
+    NameTracker.__name__: USAGE_NAMETRACKER,
+    LinkTracker.__name__: USAGE_LINKTRACKER
+}
 MAX_MESSAGE_LENGTH = 2000
+# Separator between alerts that are packed into the same message.
+MESSAGE_SEPARATOR = '\n\n'
+# Minimum time between rotations of the config backup file.
+BACKUP_PERIOD_SECONDS = 24 * 60 * 60
+# Discord rate limit for messages sent to a channel.
+CHANNEL_RATE_LIMIT_MESSAGES = 5
+CHANNEL_RATE_LIMIT_SECONDS = 5
+# Maximum attempts for sending a message that was rate limited.
+MAX_SEND_ATTEMPTS = 3
+# Maximum number of tracker updates that may run concurrently.
+MAX_CONCURRENT_UPDATES = 8
+
+# Map of tracker type names (as stored in the config) to tracker classes.
+TRACKER_TYPES = {c.__name__: c for c in (DebtTracker, NameTracker, LinkTracker)}
 
 DEFAULT_SUBSCRIBE_COMMANDS = {
     'defibot': 'DebtTracker',
@@ -61,23 +85,52 @@ class Config(object):
         self.token = ''
         # Mapping from channel name (guild#channel) to channel id (an int).
         self.channels = {}
-        # Maximum time between alerts (expressed in minutes).
+        # Set of subscribed channel ids, kept in sync with channels. Used for
+        # membership tests, while channels is used for name lookups. Use
+        # subscribe_channel() rather than modifying it directly.
+        self.channel_ids = set()
+        # Snapshot of the subscribed channel ids, safe to iterate while
+        # channels are being added.
+        self._channels_snapshot = ()
+        # Maximum time between alerts (expressed in minutes). This is the value
+        # stored in the config file.
+        self.max_wait_period_minutes = WAIT_PERIOD_MINUTES
+        # Maximum time between alerts (as a timedelta).
         self.max_wait_period = timedelta(minutes=WAIT_PERIOD_MINUTES)
         # List of trackers.
         self.trackers = []
         # Map of subscribe commands to their respective tracker types.
         self.subscribe_commands = {}
+        # Usage messages for the subscribe commands.
+        self.usage_lines = ()
+        # Map of command prefixes (e.g. '!defibot') to their subscribe commands.
+        self.command_prefixes = {}
         # Convenience map for mapping subscribe commands to their respective
         # trackers.
-        self.command_to_trackers = {}
+        self.command_to_trackers = defaultdict(list)
+        # Index of trackers keyed by their (identifier, tag) pair.
+        self._tracker_index = {}
+        # Parsed config used as the template when saving it.
+        self._config_dict = {}
+        # Whether the in-memory config has changed since it was last saved.
+        self._dirty = False
+        # Hash of the config contents that were last written to disk.
+        self._last_saved_hash = None
+        # Serializes config writes, whether they come from save_config() on
+        # the event loop or from save_config_async() in a worker thread.
+        self._write_lock = threading.Lock()
+        # Number of serialized configs so far, and the number of the one last
+        # written. Used to skip writing a config older than the one on disk.
+        self._serialize_count = 0
+        self._written_count = 0
 
         # Load from disk.
         self.load_config()
 
     def load_config(self):
         assert Path(self._config_file).is_file()
-        with open(self._config_file) as f:
-            config_json = json.loads(f.read())
+        # The file is read as bytes, leaving the UTF-8 decoding to the parser.
+        config_json = orjson.loads(Path(self._config_file).read_bytes())
 
         # Fetches the bot's token.
         self.token = config_json.get('token')
@@ -96,80 +149,72 @@ class Config(object):
             # loading from disk we must conver the str keys back to int keys.
             for channel_id_string, channel_name in config_json['channels'].items():
                 self.channels[int(channel_id_string)] = channel_name
+            self.channel_ids = set(self.channels)
+            self._channels_snapshot = tuple(self.channels)
 
         # Loads the maximum waiting period between updates.
         if 'max_wait_period' in config_json:
+            self.max_wait_period_minutes = config_json['max_wait_period']
             self.max_wait_period = timedelta(
-                minutes=config_json['max_wait_period'])
+                minutes=self.max_wait_period_minutes)
+
+        # Keeps the parsed config as the template for save_config(). Only the
+        # fields that change while the bot runs need to be patched into it.
+        # Any keys the bot doesn't know about are preserved as is.
+        self._config_dict = config_json
+        config_json['subscribe_commands'] = self.subscribe_commands
+        config_json['max_wait_period'] = self.max_wait_period_minutes
+        config_json.setdefault('channels', {})
 
         # Loads the trackers.
-        for command in self.subscribe_commands:
-            self.command_to_trackers[command] = []
         if 'trackers' in config_json:
             # Update trackers list and command-to-tracker map.
             for tracker_json in config_json['trackers']:
-                self.trackers.append(self.parse_tracker(tracker_json))
+                tracker = self.parse_tracker(tracker_json)
+                self.trackers.append(tracker)
+                self._tracker_index[(tracker.get_identifier(),
+                                     tracker.get_tag())] = tracker
             for tracker in self.trackers:
                 self.command_to_trackers[tracker.get_subscribe_command()].append(
                     tracker)
 
-        print(f'Subscribed to these channels: {self.channels}')
-        print(
-            f'Max wait period {utils.format_timedelta(self.max_wait_period)} between alerts.')
+        # Formats the usage messages for the subscribe commands once, since
+        # they don't change while the bot is running.
+        self.usage_lines = tuple(
+            USAGE_FORMATS[tracker_type].format(command=command)
+            for command, tracker_type in self.subscribe_commands.items()
+            if tracker_type in USAGE_FORMATS) + ('You may also wait for automatic updates.',)
+        # Likewise, the command prefixes are built once so that incoming
+        # messages can be dispatched with a single lookup.
+        self.command_prefixes = {
+            f'!{command}': command for command in self.subscribe_commands}
+
+        logging.info('Subscribed to these channels: %s', self.channels)
+        logging.info('Max wait period %s between alerts.',
+                     utils.format_timedelta(self.max_wait_period))
         for tracker in self.trackers:
-            print(
-                f'Tracking {tracker.get_name()}. Last update: {tracker.get_last_update_time()}. Last alert: {tracker.get_last_alert_time()}. Command: {tracker.get_subscribe_command()}.')
+            logging.info('Tracking %s. Last update: %s. Last alert: %s. Command: %s.',
+                         tracker.get_name(), tracker.get_last_update_time(),
+                         tracker.get_last_alert_time(), tracker.get_subscribe_command())
 
-    def parse_tracker(self, tracker_json: dict) -> DebtTracker:
+    def parse_tracker(self, tracker_json: dict):
         tracker_type = tracker_json['type']
-        if tracker_type == DebtTracker.__name__:
-            address = tracker_json['address']
-            tag = tracker_json.get('tag')
-            last_alert_time = tracker_json.get('last_alert_time')
-            subscribe_command = tracker_json.get('subscribe_command')
-            channels = tracker_json.get('channels')
-            ignorable_debts = tracker_json.get('ignorable_debts')
-            return DebtTracker(address, tag, subscribe_command,
-                               last_alert_time, channels, ignorable_debts)
-        elif tracker_type == NameTracker.__name__:
-            user_id = tracker_json['user_id']
-            tag = tracker_json['tag']
-            last_alert_time = tracker_json.get('last_alert_time')
-            subscribe_command = tracker_json.get('subscribe_command')
-            channels = tracker_json.get('channels')
-            return NameTracker(client=self._client,
-                               user_id=user_id,
-                               tag=tag,
-                               subscribe_command=subscribe_command,
-                               last_alert_time=last_alert_time,
-                               channels=channels)
-        elif tracker_type == LinkTracker.__name__:
-            identifier = tracker_json.get('identifier')
-            tag = tracker_json.get('tag')
-            last_alert_time = tracker_json.get('last_alert_time')
-            subscribe_command = tracker_json.get('subscribe_command')
-            channels = tracker_json.get('channels')
-            return LinkTracker(identifier=identifier,
-                               tag=tag,
-                               subscribe_command=subscribe_command,
-                               last_alert_time=last_alert_time,
-                               channels=channels)
-        else:
-            log.fatal(f'Invalid tracker type: {tracker_type}')
+        if tracker_type not in TRACKER_TYPES:
+            logging.fatal('Invalid tracker type: %s', tracker_type)
+        # Only name trackers need the Discord client, to look up members.
+        if tracker_type == NameTracker.__name__:
+            return NameTracker.from_json(tracker_json, client=self._client)
+        return TRACKER_TYPES[tracker_type].from_json(tracker_json)
 
     # Adds or updates the tracker for address/tag with the channel_id. Returns
     # the tracker object associated with this update.
     async def add_and_return_tracker(self, identifier: str, tag: Optional[str], command: str, channel_id: int):
         # Find the matching tracker for address/tag (and if it doesn't exist,
         # create one).
-        tracker = None
-        for curr_tracker in self.trackers:
-            if (curr_tracker.get_identifier() == identifier and
-                    curr_tracker.get_tag() == tag):
-                tracker = curr_tracker
+        tracker = self._tracker_index.get((identifier, tag))
         if not tracker:
             if command not in self.subscribe_commands:
-                log.fatal(f'Command {command} not among subscribe commands')
+                logging.fatal('Command %s not among subscribe commands', command)
 
             if self.subscribe_commands[command] == DebtTracker.__name__:
                 tracker = DebtTracker(address=identifier,
@@ -192,12 +237,18 @@ class Config(object):
                                       last_alert_time=None,
                                       channels=[channel_id])
             else:
-                log.fatal(
-                    f'For command {command}, invalid tracker type: {self.subscribe_commands[command]}')
+                logging.fatal('For command %s, invalid tracker type: %s',
+                              command, self.subscribe_commands[command])
 
-            await tracker.update()  # Query new debts for the first time.
-            # Update trackers list and command-to-tracker map.
+            try:
+                await tracker.update()  # Query new debts for the first time.
+            except Exception:
+                # The tracker is discarded, so release its savefile.
+                tracker.close()
+                raise
+            # Update trackers list, tracker index and command-to-tracker map.
             self.trackers.append(tracker)
+            self._tracker_index[(identifier, tag)] = tracker
             self.command_to_trackers[tracker.get_subscribe_command()].append(
                 tracker)
 
@@ -205,73 +256,184 @@ class Config(object):
         if not tracker.has_channel(channel_id):
             tracker.add_channel(channel_id)
 
-        self.save_config()
+        self.mark_dirty()
+        await self.save_config_async()
         return tracker
 
-    def save_config(self):
-        config_dict = {
-            'subscribe_commands': self.subscribe_commands,
-            'token': self.token,
-            'channels': self.channels,
-            'max_wait_period': self.max_wait_period.seconds // 60,
-            'trackers': []
-        }
-        for t in self.trackers:
-            tracker_json = {}
-
-            tracker_type = type(t).__name__
-            tracker_json['type'] = tracker_type
-
-            if tracker_type == DebtTracker.__name__:
-                tracker_json['address'] = t.get_address()
-                tag = t.get_tag()
-                if tag:
-                    tracker_json['tag'] = tag
-                tracker_json['last_alert_time'] = utils.format_storage_time(
-                    t.get_last_alert_time())
-                tracker_json['subscribe_command'] = t.get_subscribe_command()
-                tracker_json['channels'] = t.get_channels()
-                tracker_json['ignorable_debts'] = t.get_ignorable_debts()
-            elif tracker_type == NameTracker.__name__:
-                tracker_json['user_id'] = t.get_user_id()
-                tracker_json['tag'] = t.get_tag()
-                tracker_json['last_alert_time'] = utils.format_storage_time(
-                    t.get_last_alert_time())
-                tracker_json['subscribe_command'] = t.get_subscribe_command()
-                tracker_json['channels'] = t.get_channels()
-            elif tracker_type == LinkTracker.__name__:
-                tracker_json['identifier'] = t.get_identifier()
-                tracker_json['tag'] = t.get_tag()
-                tracker_json['last_alert_time'] = utils.format_storage_time(
-                    t.get_last_alert_time())
-                tracker_json['subscribe_command'] = t.get_subscribe_command()
-                tracker_json['channels'] = t.get_channels()
-            else:
-                print(f'Could not save unsupported tracker: {tracker_type}')
-                continue
+    # Flags the config as modified so that the next save_config() call writes
+    # it to disk.
+    def mark_dirty(self):
+        self._dirty = True
 
-            config_dict['trackers'].append(tracker_json)
-
-        # Create a backup first.
-        shutil.copyfile(self._config_file, self._config_file + '.backup')
-        # Store new config file.
-        with open(self._config_file, 'w') as f:
-            f.write(json.dumps(config_dict, indent=4))
+    # Writes the config to disk, but only if it was modified since the last
+    # save.
+    def save_config(self):
+        serialized = self._serialize_config()
+        if serialized:
+            self._write_config(*serialized)
+
+    # Same as save_config(), but performs the blocking disk IO in a worker
+    # thread so that the event loop stays responsive.
+    async def save_config_async(self):
+        # Serialization happens on the event loop, so the config can't change
+        # while it is being serialized.
+        serialized = self._serialize_config()
+        if serialized:
+            await asyncio.to_thread(self._write_config, *serialized)
+
+    # Serializes the config. Returns the serialized config, its hash and its
+    # serialization number, or None if there is nothing new to save.
+    def _serialize_config(self) -> Optional[Tuple[bytes, bytes, int]]:
+        if not self._dirty:
+            return None
+        self._dirty = False
+
+        # Tracker state (e.g. alert times) is updated by the trackers
+        # themselves, so the tracker list is rebuilt on every save.
+        config_dict = self._config_dict
+        config_dict['trackers'] = [t.to_json() for t in self.trackers]
+
+        # Skip the write if the serialized config is identical to what was
+        # last saved. orjson only supports a 2-space indent, so a config file
+        # written with json's indent=4 is reindented on its first save.
+        payload = orjson.dumps(config_dict, option=orjson.OPT_INDENT_2)
+        payload_hash = hashlib.blake2b(payload, digest_size=8).digest()
+        if payload_hash == self._last_saved_hash:
+            return None
+        self._serialize_count += 1
+        return payload, payload_hash, self._serialize_count
+
+    # Writes the serialized config to disk. The lock keeps concurrent saves
+    # from sharing the temporary file. Each save serializes the whole config,
+    # so a save that lost the race to a newer one is skipped.
+    def _write_config(self, payload: bytes, payload_hash: bytes, count: int):
+        with self._write_lock:
+            if count < self._written_count:
+                return
+            self._write_config_locked(payload, payload_hash)
+            self._written_count = count
+
+    # Performs the write. Must be called with _write_lock held.
+    def _write_config_locked(self, payload: bytes, payload_hash: bytes):
+        try:
+            # Write the new config to a temporary file first, so that a failure
+            # at this point leaves the current config file untouched.
+            tmp_file = self._config_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            # Rotate the backup at most once per backup period. The current
+            # config file is hard linked rather than moved aside, so a valid
+            # config file exists at every point.
+            backup_file = self._config_file + '.backup'
+            if Path(self._config_file).is_file() and (
+                    not Path(backup_file).is_file() or
+                    time.time() - os.path.getmtime(backup_file) >= BACKUP_PERIOD_SECONDS):
+                _link_or_copy(self._config_file, backup_file)
+            # Store new config file atomically by renaming the temporary file
+            # over the old one.
+            os.replace(tmp_file, self._config_file)
+        except Exception:
+            # Make sure the next save tries again.
+            self.mark_dirty()
+            raise
+        self._last_saved_hash = payload_hash
 
     def subscribe_channel(self, channel_id: int, channel_name: str):
         self.channels[channel_id] = channel_name
+        self._config_dict['channels'][str(channel_id)] = channel_name
+        self.channel_ids.add(channel_id)
+        self._channels_snapshot = tuple(self.channels)
+        self.mark_dirty()
         self.save_config()
 
     def is_subscribed(self, channel_id: int) -> bool:
-        return channel_id in self.channels
+        return channel_id in self.channel_ids
 
-    def get_subscribed_channels(self) -> List[int]:
-        return self.channels.keys()
+    def get_subscribed_channels(self) -> Tuple[int, ...]:
+        return self._channels_snapshot
+
+    # Returns the subset of channel_ids that the bot is subscribed to.
+    def filter_subscribed_channels(self, channel_ids: List[int]) -> Set[int]:
+        return self.channel_ids.intersection(channel_ids)
 
     def get_channel_name(self, channel_id: int) -> str:
         return self.channels[channel_id]
 
 
+# Replaces dst with a hard link to src, falling back to a copy on filesystems
+# without hard links. The link is made under a temporary name and renamed into
+# place, so dst is never missing. dst's modification time is set to now, since
+# a hard link shares src's.
+def _link_or_copy(src: str, dst: str):
+    tmp_dst = dst + '.tmp'
+    if os.path.lexists(tmp_dst):
+        os.remove(tmp_dst)
+    try:
+        os.link(src, tmp_dst)
+    except OSError:
+        shutil.copyfile(src, tmp_dst)
+    os.replace(tmp_dst, dst)
+    os.utime(dst)
+
+
+# Greedily packs messages into as few messages as possible, each at most limit
+# characters long (messages that are already too long are left as is). Messages
+# are only joined whole, so code blocks stay balanced within each packed
+# message.
+def _pack_messages(messages: List[str], limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    packed = []
+    for message in messages:
+        if packed and len(packed[-1]) + len(MESSAGE_SEPARATOR) + len(message) <= limit:
+            packed[-1] += MESSAGE_SEPARATOR + message
+        else:
+            packed.append(message)
+    return packed
+
+
+# Splits a message into chunks that fit within Discord's message length limit.
+# Code blocks that span chunks are closed at the end of a chunk and reopened at
+# the start of the next one. Results are cached, since the same tracker message
+# is usually sent to several channels.
+@lru_cache(maxsize=32)
+def _chunk_message(message: str, limit: int = MAX_MESSAGE_LENGTH) -> Tuple[str, ...]:
+    if len(message) <= limit:
+        return (message,)
+
+    chunks = []
+    # The buffer is kept as a list of parts (joined per chunk) to avoid
+    # repeatedly copying a growing string.
+    buffer = []
+    buffer_length = 0
+    in_code_block = False
+    for line in message.splitlines():
+        # A line may open and close a code block, so only an odd number of
+        # fences flips the state.
+        in_code_block ^= bool(line.count('```') & 1)
+        buffer.append(line)
+        buffer.append('\n')
+        buffer_length += len(line) + 1
+        if buffer_length > limit - 500:
+            # Emit existing buffer and reset the buffer variables. Add trailing
+            # ``` for the existing buffer and prepending a leading ``` for the
+            # next buffer if in_code_block == True.
+            if in_code_block:
+                buffer.append('```\n')
+            chunks.append(''.join(buffer))
+            if (in_code_block):
+                buffer = ['```\n']
+            else:
+                buffer = []
+            buffer_length = sum(len(part) for part in buffer)
+    # Emit remaining contents from buffer.
+    if in_code_block:
+        buffer.append('```\n')
+    if buffer:
+        chunks.append(''.join(buffer))
+    return tuple(chunks)
+
+
 # An Alert specifies to which channel to send a message.
 class Alert(object):
     def __init__(self,
@@ -289,33 +451,60 @@ class AntlionDeFiBot(discord.Client):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        # Initialize alerts queue.
-        self._alerts_queue = queue.Queue()
+        # Alerts queue. The queue (and the update semaphore below) are created
+        # lazily from within the event loop, since on older Python versions
+        # asyncio primitives bind to the loop that is current when they are
+        # constructed.
+        self._alerts_queue = None
+        # Bounds the number of concurrent tracker updates to avoid tripping API
+        # rate limits.
+        self._update_semaphore = None
 
         # Configuration state for the bot.
         assert 'config' in kwargs
         self._config = Config(kwargs['config'], client=self)
+        # Task that sends scheduled alerts. Started once the bot is ready.
+        self._alert_pump_task = None
+        # Token buckets for pacing sends to each channel. Maps channel ids to
+        # (last refill time, available tokens).
+        self._channel_buckets = {}
 
         # Start update task.
         self.update_task.start()
-        self.alert_task.start()
 
     def get_token(self) -> str:
         return self._config.token
 
+    async def close(self):
+        if self._alert_pump_task:
+            self._alert_pump_task.cancel()
+        # Stop updates before closing the trackers' savefiles, so that an
+        # in-flight update does not write to a closed file.
+        self.update_task.cancel()
+        for tracker in self._config.trackers:
+            tracker.close()
+        await utils.close_client()
+        await super().close()
+
+    # Returns the alerts queue, creating it on first use.
+    def _get_alerts_queue(self) -> asyncio.Queue:
+        if not self._alerts_queue:
+            self._alerts_queue = asyncio.Queue()
+        return self._alerts_queue
+
     def schedule_alert(self,
                        channel_id: int,
                        message: str,
                        urgent: bool,
                        wait_period_expired: bool):
-        self._alerts_queue.put(
+        self._get_alerts_queue().put_nowait(
             Alert(channel_id, message, urgent, wait_period_expired))
 
     async def schedule_alerts_for_channel(self, channel: discord.TextChannel,
                                           command: str, trackers: list):
         tracker_count = 0
         for tracker in trackers:
-            print(f'Comparing {tracker} with command {command}')
+            logging.debug('Comparing %s with command %s', tracker, command)
             if (tracker.has_channel(channel.id) and command == tracker.get_subscribe_command()):
                 tracker_count += 1
                 self.schedule_alert(channel.id, tracker.get_last_message(),
@@ -335,17 +524,17 @@ class AntlionDeFiBot(discord.Client):
         return tracker_output
 
     async def send_usages(self, channel: discord.TextChannel):
-        for command, tracker_type in self._config.subscribe_commands.items():
-            if tracker_type == DebtTracker.__name__:
-                await channel.send(USAGE_DEBTTRACKER.format(command=command))
-            elif tracker_type == NameTracker.__name__:
-                await channel.send(USAGE_NAMETRACKER.format(command=command))
-            elif tracker_type == LinkTracker.__name__:
-                await channel.send(USAGE_LINKTRACKER.format(command=command))
-        await channel.send('You may also wait for automatic updates.')
+        # Usage lines are sent sequentially to keep them in order.
+        for line in self._config.usage_lines:
+            await channel.send(line)
 
     async def on_ready(self):
-        print(f'Logged in as {self.user.name}#{self.user.discriminator}')
+        logging.info('Logged in as %s#%s', self.user.name,
+                     self.user.discriminator)
+        # Start sending alerts. on_ready may be called again after a reconnect,
+        # so the alert pump is only started once.
+        if not self._alert_pump_task:
+            self._alert_pump_task = asyncio.create_task(self._alert_pump())
         # Schedule alert for this channel containing current messages.
         for channel_id in self._config.get_subscribed_channels():
             channel = self.get_channel(channel_id)
@@ -357,144 +546,201 @@ class AntlionDeFiBot(discord.Client):
         if message.author == self.user:
             return
 
+        # Only messages starting with a command prefix are of interest, so
+        # bail out before tokenizing anything else.
+        content = message.content
+        if not content.startswith('!'):
+            return
+        command = self._config.command_prefixes.get(content.split(maxsplit=1)[0])
+        if not command:
+            return
+        trackers = self._config.command_to_trackers[command]
+
         channel_id = message.channel.id
         channel_name = f'{message.channel.guild.name}#{message.channel.name}'
-        message_tokens = message.content.split()
-        if not message_tokens:
-            # No message tokens to process.
-            return
-        for command, trackers in self._config.command_to_trackers.items():
-            if message_tokens[0] != f'!{command}':
-                continue
-
-            # Handles subscription commands (which add this channel to the set of
-            # channels that will be notified in future alerts).
-            if self._config.is_subscribed(channel_id) and len(message_tokens) > 1:
-                # Add/update a tracker for the given identifier and tag using this
-                # channel.
-                identifier = message_tokens[1]
-                tag = ' '.join(message_tokens[2:]) if len(
-                    message_tokens) >= 3 else None
-                print(
-                    f'User {message.author} requested update on {identifier} ({tag}).')
-                await message.channel.send(f'{message.author.mention} requested a tracker for {identifier} ({tag}). Coming right up...')
-
-                tracker = await self._config.add_and_return_tracker(identifier, tag, command, channel_id)
-                self.schedule_alert(channel_id, tracker.get_last_message(),
-                                    urgent=False,
-                                    wait_period_expired=False)
-            elif self._config.is_subscribed(channel_id):
-                # Already subscribed. Requesting update.
-                print(f'User {message.author} requested update.')
-                await message.channel.send(f'{message.author.mention} requested an update. Coming right up...')
-                await self.schedule_alerts_for_channel(message.channel, command, trackers)
-            # elif len(message_tokens) == 1:
-            #    # This is a new subscription.
-            #    self._config.subscribe_channel(channel_id, channel_name)
-
-            #    await message.channel.send('gm')
-            #    await message.channel.send('You have subscribed to updates from the Antlion DeFi Bot.')
-            #    await self.send_usages(message.channel)
-            #    await message.channel.send('For now, I will share the current trackers in this channel.')
-
-            #    print(f'Subscribed to {channel_name} ({channel_id})')
-            #    await self.schedule_alerts_for_channel(message.channel, command, trackers)
+        message_tokens = content.split()
+        is_subscribed = channel_id in self._config.channel_ids
+
+        # Handles subscription commands (which add this channel to the set of
+        # channels that will be notified in future alerts).
+        if is_subscribed and len(message_tokens) > 1:
+            # Add/update a tracker for the given identifier and tag using this
+            # channel.
+            identifier = message_tokens[1]
+            tag = ' '.join(message_tokens[2:]) if len(
+                message_tokens) >= 3 else None
+            logging.info('User %s requested update on %s (%s).',
+                         message.author, identifier, tag)
+            await message.channel.send(f'{message.author.mention} requested a tracker for {identifier} ({tag}). Coming right up...')
+
+            tracker = await self._config.add_and_return_tracker(identifier, tag, command, channel_id)
+            self.schedule_alert(channel_id, tracker.get_last_message(),
+                                urgent=False,
+                                wait_period_expired=False)
+        elif is_subscribed:
+            # Already subscribed. Requesting update.
+            logging.info('User %s requested update.', message.author)
+            await message.channel.send(f'{message.author.mention} requested an update. Coming right up...')
+            await self.schedule_alerts_for_channel(message.channel, command, trackers)
+        # elif len(message_tokens) == 1:
+        #    # This is a new subscription.
+        #    self._config.subscribe_channel(channel_id, channel_name)
+
+        #    await message.channel.send('gm')
+        #    await message.channel.send('You have subscribed to updates from the Antlion DeFi Bot.')
+        #    await self.send_usages(message.channel)
+        #    await message.channel.send('For now, I will share the current trackers in this channel.')
+
+        #    print(f'Subscribed to {channel_name} ({channel_id})')
+        #    await self.schedule_alerts_for_channel(message.channel, command, trackers)
 
     # This loop periodically updates trackers. An alert is scheduled if the
     # update returned has_alert == True, or if the maximum wait period has
     # elapsed between datetime.now() and the tracker's last alert time.
     @tasks.loop(seconds=600)
     async def update_task(self):
-        print(
-            f'Running update task at {utils.display_time(datetime.now(timezone.utc))} UTC.')
-        for tracker in self._config.trackers:
-            try:
-                has_alert, message = await tracker.update()
-            except Exception as e:
-                print(f'Exception occured while fetching URL: {e}')
-                traceback.print_exc()
-                continue
-
-            print(
-                f'Updated tracker for {tracker.get_name()} with the following message:')
-            print(message)
-
-            wait_period_expired = (
-                (datetime.now(timezone.utc) - tracker.get_last_alert_time())
-                >= self._config.max_wait_period
-            )
-            if has_alert or wait_period_expired:
-                # Manually sync the alert time to allow for the
-                # 'wait_period_expired' criterion to trigger an alert.
-                tracker.sync_last_alert_time()
-                # Raise alerts only if we have subscribed to channels.
-                for channel_id in self._config.get_subscribed_channels():
-                    if tracker.has_channel(channel_id):
+        # A single timestamp is used for the whole cycle so that all trackers
+        # share the same wait period boundary.
+        cycle_now = datetime.now(timezone.utc)
+        logging.info('Running update task at %s UTC.',
+                     utils.display_time(cycle_now))
+        try:
+            # Tracker updates are independent, so run them concurrently. A copy
+            # of the tracker list is used since new trackers may be added while
+            # the updates are in flight.
+            trackers = list(self._config.trackers)
+            results = await asyncio.gather(
+                *(self._safe_update(tracker) for tracker in trackers))
+            for tracker, result in zip(trackers, results):
+                if result is None:
+                    continue
+                has_alert, message = result
+
+                logging.debug('Updated tracker for %s with the following message:\n%s',
+                              tracker.get_name(), message)
+
+                wait_period_expired = (
+                    (cycle_now - tracker.get_last_alert_time())
+                    >= self._config.max_wait_period
+                )
+                if has_alert or wait_period_expired:
+                    # Manually sync the alert time to allow for the
+                    # 'wait_period_expired' criterion to trigger an alert.
+                    tracker.sync_last_alert_time()
+                    self._config.mark_dirty()
+                    # Raise alerts only if we have subscribed to channels.
+                    for channel_id in self._config.filter_subscribed_channels(
+                            tracker.get_channels()):
                         self.schedule_alert(channel_id, message,
                                             has_alert, wait_period_expired)
-
-            # Saves config state after updating this tracker.
-            self._config.save_config()
+                if logging.level_debug():
+                    logging.debug('Last alert time for %s: %s UTC',
+                                  tracker.get_name(),
+                                  utils.display_time(tracker.get_last_alert_time()))
+        finally:
+            # Saves config state once after updating all trackers.
+            await self._config.save_config_async()
+
+    # Updates a single tracker. Returns the (has_alert, message) result of the
+    # update, or None if the update failed.
+    async def _safe_update(self, tracker) -> Optional[Tuple[bool, str]]:
+        async with self._update_semaphore:
+            try:
+                return await tracker.update()
+            except Exception as e:
+                logging.exception('Exception occured while updating %s: %s',
+                                  tracker.get_name(), e)
+                return None
 
     @update_task.before_loop
     async def before_update_task(self):
         # Wait for bot to log in.
         await self.wait_until_ready()
-
-    async def send_long_message(self, channel, message):
-        if len(message) <= MAX_MESSAGE_LENGTH:
-            await channel.send(message)
-            return
-
-        buffer = ''
-        buffer_length = 0
-        in_code_block = False
-        for line in message.splitlines():
-            if '```' in line:
-                in_code_block = not in_code_block
-            buffer += line + '\n'
-            buffer_length += len(line) + 1
-            if buffer_length > MAX_MESSAGE_LENGTH - 500:
-                # Print existing buffer and reset the buffer variables. Add
-                # trailing ``` for the existing buffer and prepending a leading
-                # ``` for the next buffer if in_code_block == True.
-                if in_code_block:
-                    buffer += '```\n'
-                await channel.send(buffer)
-                if (in_code_block):
-                    buffer = '```\n'
-                else:
-                    buffer = ''
-                buffer_length = len(buffer)
-        # Print remaining contents from buffer.
-        if in_code_block:
-            buffer += '```\n'
-        if buffer:
-            await channel.send(buffer)
-
-    # This loop periodically checks the alert queue for alerts to send.
-    @tasks.loop(seconds=10)
-    async def alert_task(self):
-        queue = self._alerts_queue
-
-        print(
-            f'Running alert task with {queue.qsize()} alerts at {utils.display_time(datetime.now(timezone.utc))} UTC.')
-        for tracker in self._config.trackers:
-            print(
-                f'Last alert time for {tracker.get_name()}: {utils.display_time(tracker.get_last_alert_time())} UTC')
-
-        while not queue.empty():
-            alert = queue.get()
-            channel = self.get_channel(alert.channel_id)
-            print(
-                f'Sending alert to {self._config.get_channel_name(alert.channel_id)} with the following message:')
-            print(alert.message)
-            await self.send_long_message(channel, alert.message)
-            queue.task_done()
-
-    @alert_task.before_loop
-    async def before_alert_task(self):
-        await self.wait_until_ready()
+        self._update_semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPDATES)
+
+    # Waits until a message may be sent to the channel without exceeding
+    # Discord's per-channel rate limit.
+    async def _wait_for_send_token(self, channel_id: int):
+        rate = CHANNEL_RATE_LIMIT_MESSAGES / CHANNEL_RATE_LIMIT_SECONDS
+        now = time.monotonic()
+        last_time, tokens = self._channel_buckets.get(
+            channel_id, (now, CHANNEL_RATE_LIMIT_MESSAGES))
+        tokens = min(CHANNEL_RATE_LIMIT_MESSAGES,
+                     tokens + (now - last_time) * rate)
+        delay = max(0, (1 - tokens) / rate)
+        # Reserve the token before sleeping so that concurrent senders queue up
+        # behind this one.
+        self._channel_buckets[channel_id] = (now + delay,
+                                             tokens + delay * rate - 1)
+        if delay:
+            await asyncio.sleep(delay)
+
+    # Sends a message to the channel, pacing sends per channel and retrying if
+    # Discord responds with a rate limit error.
+    async def _send_message(self, channel, message: str):
+        await self._wait_for_send_token(channel.id)
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                return await channel.send(message)
+            except discord.HTTPException as e:
+                if e.status != 429 or attempts >= MAX_SEND_ATTEMPTS:
+                    raise e
+                retry_after = float(e.response.headers.get('Retry-After', 1))
+                logging.warning('Rate limited by Discord. Retrying in %.1f seconds.',
+                                retry_after)
+                await asyncio.sleep(retry_after)
+
+    async def send_long_message(self, channel, message: str):
+        for chunk in _chunk_message(message):
+            await self._send_message(channel, chunk)
+
+    # This coroutine waits on the alert queue and sends alerts as soon as they
+    # are scheduled. It runs for the lifetime of the bot.
+    async def _alert_pump(self):
+        queue = self._get_alerts_queue()
+
+        while not self.is_closed():
+            alert = await queue.get()
+
+            logging.info('Running alert task with %d alerts at %s UTC.',
+                         queue.qsize() + 1, utils.display_time(datetime.now(timezone.utc)))
+
+            # Group pending alerts by channel, preserving their order.
+            alerts_by_channel = defaultdict(list)
+            alerts_by_channel[alert.channel_id].append(alert)
+            while True:
+                try:
+                    alert = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                alerts_by_channel[alert.channel_id].append(alert)
+
+            # Channels are independent, so send to them concurrently. Alerts
+            # within a channel are still sent sequentially to keep them in
+            # order.
+            await asyncio.gather(*(self._send_channel_batch(channel_id, alerts)
+                                   for channel_id, alerts in alerts_by_channel.items()))
+
+    # Sends a list of alerts to a single channel in order. Alerts are packed
+    # into as few messages as possible to cut down on round trips.
+    async def _send_channel_batch(self, channel_id: int, alerts: List[Alert]):
+        try:
+            channel = self.get_channel(channel_id)
+            logging.info('Sending %d alerts to %s.', len(alerts),
+                         self._config.get_channel_name(channel_id))
+            for message in _pack_messages([alert.message for alert in alerts]):
+                logging.debug('Alert message:\n%s', message)
+                await self.send_long_message(channel, message)
+        except Exception as e:
+            # A failure for one channel must not take down the alert pump or
+            # the sends to other channels.
+            logging.exception('Exception occured while sending alerts to %s: %s',
+                              channel_id, e)
+        finally:
+            for _ in alerts:
+                self._alerts_queue.task_done()
 
 
 def main(argv):
@@ -1,3 +1,3 @@
 #!/bin/bash
 
-pip3 install absl-py httpx py-cord pyformat
+pip3 install absl-py httpx orjson py-cord pyformat
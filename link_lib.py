@@ -7,77 +7,100 @@
 # This library queries the Zapper API.
 
 import utils
-import json
-import io
+import orjson
 import csv
 import asyncio
+from typing import Dict
 from typing import Tuple
 from typing import Optional
 from typing import List
 from utils import fetch_url
 from utils import display_time
-from pathlib import Path
 from datetime import timezone
 from datetime import timedelta
 from datetime import datetime
-from absl import logging
+from time import monotonic
 
 
 LINK_NAME = 'chainlink'
 ETH_NAME = 'ethereum'
-COINGECKO_PRICE_FMT = 'https://api.coingecko.com/api/v3/coins/{token_name}/market_chart?vs_currency=usd&days=1&interval=minute'
+COINGECKO_PRICE_FMT = 'https://api.coingecko.com/api/v3/simple/price?ids={token_names}&vs_currencies=usd&include_24hr_change=true'
+PRICES_URL = COINGECKO_PRICE_FMT.format(token_names=f'{LINK_NAME},{ETH_NAME}')
+# CoinGecko responses are reused for this long, to absorb repeated polls.
+PRICES_CACHE_SECONDS = 60
 
+SAVEFILE_BUFFER_BYTES = 8192
 SAVEFILE_FIELDS = ['time', 'link_prev', 'link_now', 'link_change',
                    'eth_prev', 'eth_now', 'eth_change', 'link_vs_eth']
 ALERT_THRESHOLD = 0.03
 
 
+# An open savefile shared by the LinkTrackers writing to it.
+class _Savefile(object):
+    __slots__ = ('file', 'writer', 'users')
+
+    def __init__(self, file, writer):
+        self.file = file
+        self.writer = writer
+        # Number of trackers holding the savefile open.
+        self.users = 0
+
+
+# Open savefiles, keyed by path. Every LinkTracker writes to the same savefile,
+# so its handle and writer are shared rather than held per tracker.
+_SAVEFILES: Dict[str, _Savefile] = {}
+
+# The last CoinGecko response, with the monotonic time at which it was fetched.
+_PRICES_RESPONSE: Optional[Tuple[float, bytes]] = None
+# Makes concurrent callers share a single in-flight CoinGecko query. Created
+# lazily from within the event loop.
+_PRICES_LOCK: Optional[asyncio.Lock] = None
+
+
 class Prices(object):
-    def __init__(self, **kwargs):
-        for key, value in kwargs.items():
-            if key == 'time':
-                self.time = value
-            elif key == 'link_prev':
-                self.link_prev = value
-            elif key == 'link_now':
-                self.link_now = value
-            elif key == 'link_change':
-                self.link_change = value
-            elif key == 'eth_prev':
-                self.eth_prev = value
-            elif key == 'eth_now':
-                self.eth_now = value
-            elif key == 'eth_change':
-                self.eth_change = value
-            elif key == 'link_vs_eth':
-                self.link_vs_eth = value
-            elif key == 'csv_row':
-                self.from_csv_row(value)
-                break
-            else:
-                logging.fatal('Ineligible key: ' + key)
-
-    def from_csv_row(self, dict_in: dict):
-        self.time = utils.parse_storage_time(dict_in['time'])
-        self.link_prev = float(dict_in['link_prev'])
-        self.link_now = float(dict_in['link_now'])
-        self.link_change = float(dict_in['link_change'])
-        self.eth_prev = float(dict_in['eth_prev'])
-        self.eth_now = float(dict_in['eth_now'])
-        self.eth_change = float(dict_in['eth_change'])
-        self.link_vs_eth = float(dict_in['link_vs_eth'])
-
-    def to_csv_row(self) -> dict:
-        result = {}
-        result['time'] = utils.format_storage_time(self.time)
-        result['link_prev'] = self.link_prev
-        result['link_now'] = self.link_now
-        result['link_change'] = self.link_change
-        result['eth_prev'] = self.eth_prev
-        result['eth_now'] = self.eth_now
-        result['eth_change'] = self.eth_change
-        result['link_vs_eth'] = self.link_vs_eth
-        return result
+    __slots__ = ('time', 'link_prev', 'link_now', 'link_change',
+                 'eth_prev', 'eth_now', 'eth_change', 'link_vs_eth')
+
+    def __init__(self,
+                 *,
+                 time: datetime,
+                 link_prev: float,
+                 link_now: float,
+                 link_change: float,
+                 eth_prev: float,
+                 eth_now: float,
+                 eth_change: float,
+                 link_vs_eth: float):
+        self.time = time
+        self.link_prev = link_prev
+        self.link_now = link_now
+        self.link_change = link_change
+        self.eth_prev = eth_prev
+        self.eth_now = eth_now
+        self.eth_change = eth_change
+        self.link_vs_eth = link_vs_eth
+
+    @classmethod
+    def from_csv_row(cls, dict_in: dict) -> 'Prices':
+        return cls(time=utils.parse_storage_time(dict_in['time']),
+                   link_prev=float(dict_in['link_prev']),
+                   link_now=float(dict_in['link_now']),
+                   link_change=float(dict_in['link_change']),
+                   eth_prev=float(dict_in['eth_prev']),
+                   eth_now=float(dict_in['eth_now']),
+                   eth_change=float(dict_in['eth_change']),
+                   link_vs_eth=float(dict_in['link_vs_eth']))
+
+    # Returns the savefile row for these prices, in SAVEFILE_FIELDS order.
+    def to_tuple(self) -> tuple:
+        return (utils.format_storage_time(self.time),
+                self.link_prev,
+                self.link_now,
+                self.link_change,
+                self.eth_prev,
+                self.eth_now,
+                self.eth_change,
+                self.link_vs_eth)
 
 
 def _get_savefile() -> str:
@@ -86,34 +109,70 @@ def _get_savefile() -> str:
 
 
 def _query_prev_prices(savefile: str) -> Optional[Prices]:
-    last_row = None
-    with open(savefile, newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            last_row = row
+    last_row = utils.read_last_csv_row(savefile)
+    return Prices.from_csv_row(last_row) if last_row else None
+
+
+# Opens the savefile for appending, or shares the handle if it is already open.
+# A header is written if the savefile is new.
+def _open_savefile(savefile: str):
+    shared = _SAVEFILES.get(savefile)
+    if shared is None:
+        csv_file = open(savefile, 'a', newline='',
+                        buffering=SAVEFILE_BUFFER_BYTES)
+        writer = csv.writer(csv_file)
+        if csv_file.tell() == 0:
+            writer.writerow(SAVEFILE_FIELDS)
+            csv_file.flush()
+        shared = _SAVEFILES[savefile] = _Savefile(csv_file, writer)
+    shared.users += 1
+
+
+# Releases a handle from _open_savefile(), closing the file once no tracker
+# uses it.
+def _close_savefile(savefile: str):
+    shared = _SAVEFILES[savefile]
+    shared.users -= 1
+    if shared.users == 0:
+        shared.file.close()
+        del _SAVEFILES[savefile]
+
+
+# Appends a row to an open savefile and flushes it.
+def _write_prices(prices: Prices, savefile: str):
+    shared = _SAVEFILES[savefile]
+    shared.writer.writerow(prices.to_tuple())
+    shared.file.flush()
 
-    return Prices(csv_row=last_row) if last_row else None
 
+# Returns the CoinGecko prices response, reusing one fetched within the last
+# PRICES_CACHE_SECONDS.
+async def _fetch_prices_response() -> bytes:
+    global _PRICES_RESPONSE, _PRICES_LOCK
+    if _PRICES_LOCK is None:
+        _PRICES_LOCK = asyncio.Lock()
 
-def _write_prices(prices: Prices, savefile: str):
-    with open(savefile, 'a', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, SAVEFILE_FIELDS)
-        writer.writerow(prices.to_csv_row())
+    async with _PRICES_LOCK:
+        if (_PRICES_RESPONSE and
+                monotonic() - _PRICES_RESPONSE[0] < PRICES_CACHE_SECONDS):
+            return _PRICES_RESPONSE[1]
+        response = await fetch_url(PRICES_URL)
+        _PRICES_RESPONSE = (monotonic(), response)
+        return response
 
 
 async def _get_prices() -> Prices:
-    link_response = await fetch_url(COINGECKO_PRICE_FMT.format(token_name=LINK_NAME))
+    # A single query returns the current prices and 24 hour changes of both
+    # tokens, from which the prices 24 hours ago are derived.
+    response = orjson.loads(await _fetch_prices_response())
 
-    link_response = json.loads(link_response)
-    link_prev = link_response['prices'][0][1]
-    link_now = link_response['prices'][-1][1]
-    link_change = (link_now - link_prev) / link_prev
+    link_now = response[LINK_NAME]['usd']
+    link_change = response[LINK_NAME]['usd_24h_change'] / 100
+    link_prev = link_now / (1 + link_change)
 
-    eth_response = await fetch_url(COINGECKO_PRICE_FMT.format(token_name=ETH_NAME))
-    eth_response = json.loads(eth_response)
-    eth_prev = eth_response['prices'][0][1]
-    eth_now = eth_response['prices'][-1][1]
-    eth_change = (eth_now - eth_prev) / eth_prev
+    eth_now = response[ETH_NAME]['usd']
+    eth_change = response[ETH_NAME]['usd_24h_change'] / 100
+    eth_prev = eth_now / (1 + eth_change)
 
     link_vs_eth = link_change - eth_change
 
@@ -128,17 +187,15 @@ async def _get_prices() -> Prices:
 
 
 def _prepare_message(prices: Prices, last_alert_time: datetime) -> Tuple[bool, str]:
-    output = io.StringIO()
-    print(f'LINK vs ETH: {prices.link_vs_eth * 100:+.2f}%', file=output)
-    print('```', file=output)
-    print(f'--24 HR change--', file=output)
-    print(f'LINK: ${prices.link_prev:9.3f} -> ${prices.link_now:9.3f} ({prices.link_change*100:+.2f}%)', file=output)
-    print(
-        f'ETH : ${prices.eth_prev:9.3f} -> ${prices.eth_now:9.3f} ({prices.eth_change*100:+.2f}%)', file=output)
-    print(f'Last checked: {display_time(prices.time)} UTC', file=output)
-    print('```', file=output)
-
-    message = output.getvalue()
+    message = (
+        f'LINK vs ETH: {prices.link_vs_eth * 100:+.2f}%\n'
+        '```\n'
+        '--24 HR change--\n'
+        f'LINK: ${prices.link_prev:9.3f} -> ${prices.link_now:9.3f} ({prices.link_change*100:+.2f}%)\n'
+        f'ETH : ${prices.eth_prev:9.3f} -> ${prices.eth_now:9.3f} ({prices.eth_change*100:+.2f}%)\n'
+        f'Last checked: {display_time(prices.time)} UTC\n'
+        '```\n')
+
     # At least 3 hours elapsed since last alert.
     has_alert = ((prices.link_vs_eth >= ALERT_THRESHOLD) and
                  (prices.link_change >= 0))
@@ -167,6 +224,8 @@ class LinkTracker(object):
         self._last_update_time = utils.MIN_TIME
         # A list of channel IDs subscribed to this tracker.
         self._channels = channels if channels else []
+        # The same channel IDs as a set, for constant time membership tests.
+        self._channel_set = set(self._channels)
 
         # The last time the tracker raised an alert. This is set internally by
         # the sync_last_alert_time() call, as well as externally during
@@ -180,15 +239,32 @@ class LinkTracker(object):
         # update() or _get_last_update().
         self._last_message = f'{self.get_name()} tracker just initialized.'
 
-        # Creates a new savefile if needed.
-        if not Path(self._savefile).is_file():
-            with open(self._savefile, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, SAVEFILE_FIELDS)
-                writer.writeheader()
+        # The savefile is held open for appending for the lifetime of the
+        # tracker, so that writes do not reopen it every time.
+        _open_savefile(self._savefile)
+        self._savefile_open = True
 
         # Load the latest saved debt data.
         self._get_last_update()
 
+    # Creates a LinkTracker from its JSON representation in the bot config.
+    @classmethod
+    def from_json(cls, tracker_json: dict) -> 'LinkTracker':
+        return cls(identifier=tracker_json.get('identifier'),
+                   tag=tracker_json.get('tag'),
+                   subscribe_command=tracker_json.get('subscribe_command'),
+                   last_alert_time=tracker_json.get('last_alert_time'),
+                   channels=tracker_json.get('channels'))
+
+    # Returns the JSON representation of this tracker for the bot config.
+    def to_json(self) -> dict:
+        return {'type': type(self).__name__,
+                'identifier': self._identifier,
+                'tag': self._tag,
+                'last_alert_time': utils.format_storage_time(self._last_alert_time),
+                'subscribe_command': self._subscribe_command,
+                'channels': self._channels}
+
     def get_name(self) -> str:
         return self._identifier
 
@@ -211,14 +287,22 @@ class LinkTracker(object):
         return self._channels
 
     def has_channel(self, channel_id: int) -> bool:
-        return channel_id in self._channels
+        return channel_id in self._channel_set
 
     def add_channel(self, channel_id: int):
         self._channels.append(channel_id)
+        self._channel_set.add(channel_id)
 
     def get_subscribe_command(self) -> str:
         return self._subscribe_command
 
+    # Closes the savefile. The tracker should not be updated afterwards. Safe to
+    # call more than once.
+    def close(self):
+        if self._savefile_open:
+            _close_savefile(self._savefile)
+            self._savefile_open = False
+
     # Sets the last alert time to the last update time. This is useful when
     # there is some caller that is using a different criteria for triggering an
     # alert.
@@ -250,8 +334,6 @@ class LinkTracker(object):
     # current time. The _last_alert_time is updated to the _last_update_time if
     # this update raised an alert.
     async def update(self) -> Tuple[bool, str]:
-        savefile = self._savefile
-
         # Get current prices.
         prices = await _get_prices()
 
@@ -263,6 +345,6 @@ class LinkTracker(object):
         if has_alert:
             self.sync_last_alert_time()
 
-        _write_prices(prices, savefile)
+        _write_prices(prices, self._savefile)
 
         return has_alert, message
@@ -9,7 +9,6 @@
 from absl import logging
 from datetime import datetime
 from datetime import timezone
-from pathlib import Path
 from typing import List
 from typing import Optional
 from typing import Tuple
@@ -18,39 +17,27 @@ import csv
 import discord
 import utils
 
+SAVEFILE_BUFFER_BYTES = 8192
 SAVEFILE_FIELDS = ['time', 'user_id', 'tag', 'name']
+TIME_COLUMN = SAVEFILE_FIELDS.index('time')
+NAME_COLUMN = SAVEFILE_FIELDS.index('name')
 
 
 class Name(object):
-    def __init__(self, **kwargs):
-        for key, value in kwargs.items():
-            if key == 'time':
-                self.time = value
-            elif key == 'user_id':
-                self.user_id = value
-            elif key == 'tag':
-                self.tag = value
-            elif key == 'name':
-                self.name = value
-            elif key == 'csv_row':
-                self.from_csv_row(value)
-                break
-            else:
-                logging.fatal('Ineligible key: ' + key)
+    __slots__ = ('time', 'user_id', 'tag', 'name')
 
-    def from_csv_row(self, dict_in: dict):
-        self.time = utils.parse_storage_time(dict_in['time'])
-        self.user_id = dict_in['user_id']
-        self.tag = dict_in['tag']
-        self.name = dict_in['name']
+    def __init__(self, *, time: datetime, user_id: str, tag: str, name: str):
+        self.time = time
+        self.user_id = user_id
+        self.tag = tag
+        self.name = name
 
-    def to_csv_row(self) -> dict:
-        result = {}
-        result['time'] = utils.format_storage_time(self.time)
-        result['user_id'] = self.user_id
-        result['tag'] = self.tag
-        result['name'] = self.name
-        return result
+    # Returns the savefile row for this name, in SAVEFILE_FIELDS order.
+    def to_tuple(self) -> tuple:
+        return (utils.format_storage_time(self.time),
+                self.user_id,
+                self.tag,
+                self.name)
 
 
 def _get_savefile(user_id: int, tag: str) -> str:
@@ -58,20 +45,16 @@ def _get_savefile(user_id: int, tag: str) -> str:
     return f'{filename}.csv'
 
 
-def _query_prev_name(savefile: str) -> Optional[Name]:
-    last_row = None
-    with open(savefile, newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            last_row = row
-
-    return Name(csv_row=last_row) if last_row else None
-
-
-def _write_name(name: Name, savefile: str):
-    with open(savefile, 'a', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, SAVEFILE_FIELDS)
-        writer.writerow(name.to_csv_row())
+# Returns the last recorded name. Only the time and name are taken from the
+# savefile, since the user ID and tag are already known from its filename.
+def _query_prev_name(savefile: str, user_id: str, tag: str) -> Optional[Name]:
+    values = utils.read_last_csv_values(savefile)
+    if not values:
+        return None
+    return Name(time=utils.parse_storage_time(values[TIME_COLUMN]),
+                user_id=user_id,
+                tag=tag,
+                name=values[NAME_COLUMN])
 
 
 class NameTracker(object):
@@ -97,6 +80,11 @@ class NameTracker(object):
         self._last_update_time = utils.MIN_TIME
         # A list of channel IDs subscribed to this tracker.
         self._channels = channels if channels else []
+        # The same channel IDs as a set, for constant time membership tests.
+        self._channel_set = set(self._channels)
+        # The most recently recorded name. The tracker is the only writer to
+        # its savefile, so this mirrors the last row and spares re-reading it.
+        self._last_name: Optional[Name] = None
 
         # The last time the tracker raised an alert. This is set internally by
         # the sync_last_alert_time() call, as well as externally during
@@ -110,15 +98,40 @@ class NameTracker(object):
         # update() or _get_last_update().
         self._last_message = f'{self.get_name()} tracker just initialized.'
 
-        # Creates a new savefile if needed.
-        if not Path(self._savefile).is_file():
-            with open(self._savefile, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, SAVEFILE_FIELDS)
-                writer.writeheader()
+        # The savefile is held open for appending for the lifetime of the
+        # tracker, so that writes do not reopen it every time. A header is
+        # written if the savefile is new.
+        self._csv_file = open(self._savefile, 'a', newline='',
+                              buffering=SAVEFILE_BUFFER_BYTES)
+        self._csv_writer = csv.writer(self._csv_file)
+        if self._csv_file.tell() == 0:
+            self._csv_writer.writerow(SAVEFILE_FIELDS)
+            self._csv_file.flush()
 
         # Load the latest saved debt data.
         self._get_last_update()
 
+    # Creates a NameTracker from its JSON representation in the bot config.
+    @classmethod
+    def from_json(cls,
+                  tracker_json: dict,
+                  client: discord.Client) -> 'NameTracker':
+        return cls(client=client,
+                   user_id=tracker_json['user_id'],
+                   tag=tracker_json['tag'],
+                   subscribe_command=tracker_json.get('subscribe_command'),
+                   last_alert_time=tracker_json.get('last_alert_time'),
+                   channels=tracker_json.get('channels'))
+
+    # Returns the JSON representation of this tracker for the bot config.
+    def to_json(self) -> dict:
+        return {'type': type(self).__name__,
+                'user_id': self._user_id,
+                'tag': self._tag,
+                'last_alert_time': utils.format_storage_time(self._last_alert_time),
+                'subscribe_command': self._subscribe_command,
+                'channels': self._channels}
+
     def get_name(self) -> str:
         return f'{self._tag}'
 
@@ -144,26 +157,39 @@ class NameTracker(object):
         return self._channels
 
     def has_channel(self, channel_id: int) -> bool:
-        return channel_id in self._channels
+        return channel_id in self._channel_set
 
     def add_channel(self, channel_id: int):
         self._channels.append(channel_id)
+        self._channel_set.add(channel_id)
 
     def get_subscribe_command(self) -> str:
         return self._subscribe_command
 
+    # Closes the savefile. The tracker should not be updated afterwards. Safe to
+    # call more than once.
+    def close(self):
+        if not self._csv_file.closed:
+            self._csv_file.close()
+
     # Sets the last alert time to the last update time. This is useful when
     # there is some caller that is using a different criteria for triggering an
     # alert.
     def sync_last_alert_time(self):
         self._last_alert_time = self._last_update_time
 
+    # Appends a row to the savefile and flushes it.
+    def _write_name(self, name: Name):
+        self._csv_writer.writerow(name.to_tuple())
+        self._csv_file.flush()
+
     # An internal function that fetches the current state of the tracker without
     # performing new queries.
     def _get_last_update(self) -> Tuple[bool, str]:
         savefile = self._savefile
 
-        name = _query_prev_name(savefile)
+        name = _query_prev_name(savefile, self._user_id, self._tag)
+        self._last_name = name
 
         if not name:
             return False, f'No name inferred for {self.get_name()}.'
@@ -185,19 +211,18 @@ class NameTracker(object):
     async def update(self) -> Tuple[bool, str]:
         user_id = self._user_id
         tag = self._tag
-        savefile = self._savefile
 
         # Get current username.
         member = None
         for channel_id in self._channels:
             channel = self._client.get_channel(channel_id)
             member = await channel.guild.fetch_member(int(user_id))
-            print(f'Found member: {member}')
+            logging.debug('Found member: %s', member)
             if member:
                 break
 
         if not member:
-            print(f'Unable to find user: {user_id}')
+            logging.warning('Unable to find user: %s', user_id)
             return False, f'Unable to find user {user_id}'
         if member.nick:
             name_string = f'{member.nick} ({member.name}#{member.discriminator})'
@@ -209,7 +234,7 @@ class NameTracker(object):
                     name=name_string)
 
         # Get previous username.
-        prev_name = _query_prev_name(savefile)
+        prev_name = self._last_name
 
         message = f'**{self.get_name()}** tracker: '
         if not prev_name:
@@ -229,6 +254,7 @@ class NameTracker(object):
         if has_alert:
             self.sync_last_alert_time()
 
-        _write_name(name, savefile)
+        self._last_name = name
+        self._write_name(name)
 
         return has_alert, message
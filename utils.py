@@ -1,41 +1,152 @@
 # This library provides utility functions for this project.
 
+from absl import logging
 from datetime import datetime
 from datetime import MINYEAR
 from datetime import timedelta
 from datetime import timezone
+from functools import lru_cache
+from typing import List
+from typing import Optional
+from typing import Tuple
+import asyncio
+import csv
 import httpx
+import os
+import random
 
 MAX_ATTEMPTS = 3
+# Bounds of the exponential backoff between fetch attempts.
+RETRY_INITIAL_SECONDS = 0.5
+RETRY_MAX_SECONDS = 8
+# Upper bound on how long a Retry-After header may delay the next attempt.
+MAX_RETRY_AFTER_SECONDS = 60
 TIME_STORAGE_FMT = '%Y-%m-%d %H:%M:%S%z'
-TIME_DISPLAY_FMT = '%Y-%m-%d %H:%M:%S'
 MIN_TIME = datetime(year=MINYEAR, month=1, day=1, tzinfo=timezone.utc)
+CSV_TAIL_BYTES = 4096
+# Connection pool limits for the process-wide HTTP client, which is shared by the
+# bot and all trackers.
+HTTP_LIMITS = httpx.Limits(max_connections=50,
+                           max_keepalive_connections=20,
+                           keepalive_expiry=60)
 
-# Makes a GET request to a URL and stores the result as a text string.
+# Process-wide HTTP client used by fetch_url.
+_CLIENT: Optional[httpx.AsyncClient] = None
 
 
-async def fetch_url(url: str) -> str:
+# Returns the process-wide HTTP client, creating it on first use. Reusing the
+# client keeps connections (and their TLS sessions) alive between requests.
+def get_client() -> httpx.AsyncClient:
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        _CLIENT = httpx.AsyncClient(timeout=60, limits=HTTP_LIMITS)
+    return _CLIENT
+
+
+# Closes the process-wide HTTP client. Call this before the event loop exits.
+async def close_client():
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
+
+# Makes a GET request to a URL and returns the raw response body. The bytes are
+# left undecoded so that JSON callers can hand them straight to orjson. The
+# request goes through the process-wide client.
+
+
+async def fetch_url(url: str) -> bytes:
     attempts = 0
-    result = ''
-    print(f'Fetching url: {url}')
+    logging.debug('Fetching url: %s', url)
     while attempts < MAX_ATTEMPTS:
         attempts += 1
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers={'accept': '*/*'}, timeout=60)
+            response = await get_client().get(
+                url, headers={'accept': '*/*'}, timeout=60)
             if response.status_code != 200:
-                raise Exception('URL fetch attempt did not return 200')
-            result = str(response.text)
-            return result
-        except Exception as e:
-            if attempts >= MAX_ATTEMPTS:
+                raise httpx.HTTPStatusError(
+                    f'URL fetch attempt returned {response.status_code}',
+                    request=response.request, response=response)
+            return response.content
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            if attempts >= MAX_ATTEMPTS or not _is_retryable(e):
                 raise e
-            else:
-                print(f'Retrying due to exception: {e}')
+            delay = _get_retry_delay(e, attempts)
+            logging.warning('Retrying in %.1f seconds due to exception: %s',
+                            delay, e)
+            await asyncio.sleep(delay)
     raise Exception('Should not reach this part.')
 
 
+# Transport errors, rate limiting and server errors are worth retrying. Other
+# client errors will fail the same way again.
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        status = e.response.status_code
+        return status == 429 or status >= 500
+    return True
+
+
+# Returns how long to wait before the next fetch attempt. Honors the Retry-After
+# header of a rate limited response, and otherwise backs off exponentially with
+# full jitter so that concurrent retries do not land together.
+def _get_retry_delay(e: Exception, attempts: int) -> float:
+    if isinstance(e, httpx.HTTPStatusError):
+        retry_after = e.response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return min(float(retry_after), MAX_RETRY_AFTER_SECONDS)
+    backoff = min(RETRY_INITIAL_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    return random.uniform(0, backoff)
+
+
+# Returns the last row of a CSV savefile as a dict keyed by the header fields, or
+# None if the file has no rows. Only the header and the tail of the file are
+# read, so the cost does not grow with the size of the savefile.
+def read_last_csv_row(savefile: str,
+                      tail_bytes: int = CSV_TAIL_BYTES) -> Optional[dict]:
+    header, last_line = _read_last_line(savefile, tail_bytes)
+    if last_line is None:
+        return None
+    reader = csv.DictReader([header.decode(), last_line.decode()])
+    return next(reader, None)
+
+
+# Same as read_last_csv_row, but returns the row's values in column order
+# without mapping them to the header fields.
+def read_last_csv_values(savefile: str,
+                         tail_bytes: int = CSV_TAIL_BYTES) -> Optional[List[str]]:
+    _, last_line = _read_last_line(savefile, tail_bytes)
+    if last_line is None:
+        return None
+    return next(csv.reader([last_line.decode()]), None)
+
+
+# Returns the header line and the last non-empty line of a savefile. Falls back
+# to reading the whole file if the last line is longer than the tail chunk.
+def _read_last_line(savefile: str,
+                    tail_bytes: int) -> Tuple[bytes, Optional[bytes]]:
+    with open(savefile, 'rb') as f:
+        header = f.readline()
+        size = os.path.getsize(savefile)
+        start = max(len(header), size - tail_bytes)
+        f.seek(start)
+        lines = f.read().splitlines()
+
+        # If the tail starts mid-file, its first line may be partial.
+        if start > len(header):
+            if len(lines) < 2:
+                f.seek(len(header))
+                lines = f.read().splitlines()
+            else:
+                lines = lines[1:]
+
+    last_line = next((line for line in reversed(lines) if line.strip()), None)
+    return header, last_line
+
+
 # Formats timedelta into something more readable.
+@lru_cache(maxsize=128)
 def format_timedelta(delta: timedelta) -> str:
     tokens = []
     days = delta.days
@@ -56,14 +167,49 @@ def format_timedelta(delta: timedelta) -> str:
 
 # Formats datetime into a display format.
 def display_time(time: datetime) -> str:
-    return time.strftime(TIME_DISPLAY_FMT)
+    # The display format shows neither sub-second precision nor the timezone,
+    # so both are dropped from the cache key to improve the hit rate.
+    return _display_wall_time(time.replace(microsecond=0, tzinfo=None))
 
 
-# Formats the datetime into a storage representation string.
+@lru_cache(maxsize=128)
+def _display_wall_time(time: datetime) -> str:
+    return _format_wall_time(time)
+
+
+# Formats the datetime into a storage representation string, matching
+# TIME_STORAGE_FMT. This is not memoized: aware datetimes for the same instant
+# hash equal regardless of their offset, so a cache would return the wrong %z.
 def format_storage_time(time: datetime) -> str:
-    return time.strftime(TIME_STORAGE_FMT)
+    return _format_wall_time(time) + _format_utc_offset(time.utcoffset())
+
+
+# Formats the date and time of day as '%Y-%m-%d %H:%M:%S'. The fields are
+# formatted directly, which is much faster than strftime and always pads the
+# year to four digits (glibc's strftime does not, which strptime rejects).
+def _format_wall_time(time: datetime) -> str:
+    return (f'{time.year:04d}-{time.month:02d}-{time.day:02d} '
+            f'{time.hour:02d}:{time.minute:02d}:{time.second:02d}')
+
+
+# Formats a UTC offset the way strftime's %z does, e.g. '+0000' or '-0530'.
+@lru_cache(maxsize=32)
+def _format_utc_offset(offset: Optional[timedelta]) -> str:
+    if offset is None:
+        return ''
+    sign = '-' if offset < timedelta(0) else '+'
+    hours, rest = divmod(abs(offset), timedelta(hours=1))
+    minutes, rest = divmod(rest, timedelta(minutes=1))
+    result = f'{sign}{hours:02d}{minutes:02d}'
+    if rest:
+        result += f'{rest.seconds:02d}'
+        if rest.microseconds:
+            result += f'.{rest.microseconds:06d}'
+    return result
 
 
-# Parses a datetime from a storage representation string.
+# Parses a datetime from a storage representation string. strptime is slow, and
+# the same timestamps are parsed repeatedly (e.g. alert times in the config).
+@lru_cache(maxsize=1024)
 def parse_storage_time(time_string: str) -> datetime:
     return datetime.strptime(time_string, TIME_STORAGE_FMT)